@@ -1,13 +1,38 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from PIL import Image
 from io import BytesIO
+from functools import partial
+from typing import List, Optional, Tuple
+import asyncio
 import json
 import os
+import secrets
+import tempfile
 
-from .models.data_models import PatientInfo, ExternalFactor, AnalysisResult
+from .models.data_models import (
+    PatientInfo,
+    ExternalFactor,
+    AnalysisResult,
+    FactorsUpdate,
+    ProfilingRequest,
+    SequenceAnalysisResult,
+)
 from .models.detection import DetectionModel
 from .models.acne import ExternalFactorsAnalyzer, AcneAnalysisSystem
+from .models.profiling import RequestProfiler
+from .models.store import AnalysisNotFound, AnalysisStore
+from .models.frames import iter_image_frames, iter_video_frames
+from .models.scheduling import (
+    AnalysisScheduler,
+    ClientDisconnected,
+    Deadline,
+    DeadlineExceeded,
+    QueueRejected,
+    watch_disconnect,
+)
 
 app = FastAPI()
 
@@ -34,33 +59,273 @@ factor_weights = {
     # Add other acne type-specific weights here if needed
 }
 external_factors_analyzer = ExternalFactorsAnalyzer(factor_weights)
-acne_analysis_system = AcneAnalysisSystem(detection_model, external_factors_analyzer)
+# Análisis recientes que pueden recalcularse si el paciente corrige sus factores
+analysis_store = AnalysisStore(
+    max_entries=int(os.getenv("ANALYSIS_STORE_SIZE", "128")),
+    ttl=float(os.getenv("ANALYSIS_STORE_TTL", "3600")),
+    max_bytes=int(os.getenv("ANALYSIS_STORE_MAX_BYTES", str(64 << 20))),
+)
+acne_analysis_system = AcneAnalysisSystem(
+    detection_model, external_factors_analyzer, analysis_store
+)
+
+# Plazos por solicitud (segundos); el cliente puede pedir uno con X-Request-Timeout
+default_request_timeout = float(os.getenv("ANALYSIS_DEFAULT_TIMEOUT", "30"))
+max_request_timeout = float(os.getenv("ANALYSIS_MAX_TIMEOUT", "120"))
+analysis_scheduler = AnalysisScheduler(
+    {
+        "analyze": AcneAnalysisSystem.STAGES,
+        "sequence": AcneAnalysisSystem.SEQUENCE_STAGES,
+        "factors": AcneAnalysisSystem.FACTOR_STAGES,
+    },
+    max_workers=int(os.getenv("ANALYSIS_WORKERS", "1")),
+)
+
+# Perfilado opcional; PROFILE_REQUESTS=N captura las próximas N solicitudes
+admin_token = os.getenv("ADMIN_TOKEN")
+request_profiler = RequestProfiler(
+    os.getenv(
+        "PROFILE_OUTPUT_DIR", os.path.join(os.path.dirname(__file__), "profiles")
+    ),
+    max_captures=int(os.getenv("PROFILE_MAX_CAPTURES", "20")),
+)
+request_profiler.arm(
+    int(os.getenv("PROFILE_REQUESTS", "0")),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "1.0")),
+)
+
+# Análisis de ráfagas/video: cuadros más nítidos que pasan por el modelo
+max_sequence_top_k = int(os.getenv("SEQUENCE_MAX_TOP_K", "8"))
+video_chunk_size = 1024 * 1024
+
+
+def _request_deadline(x_request_timeout: Optional[float]) -> Deadline:
+    if x_request_timeout is None:
+        return Deadline(min(default_request_timeout, max_request_timeout))
+    if x_request_timeout <= 0:
+        raise HTTPException(
+            status_code=400, detail="X-Request-Timeout must be greater than 0"
+        )
+    return Deadline(min(x_request_timeout, max_request_timeout))
+
+
+def _parse_patient_inputs(
+    patient_info: str, factors: str
+) -> Tuple[PatientInfo, List[ExternalFactor]]:
+    return (
+        PatientInfo(**json.loads(patient_info)),
+        [ExternalFactor(**factor) for factor in json.loads(factors)],
+    )
+
+
+def _queue_rejected_error(e: QueueRejected) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(int(e.estimated_completion) + 1)},
+    )
+
+
+async def _run_analysis(request: Request, deadline: Deadline, label: str, fn, *args):
+    watcher = asyncio.ensure_future(watch_disconnect(request, deadline))
+    try:
+        return await analysis_scheduler.run(
+            deadline, label, request_profiler.wrap(fn, label), *args
+        )
+
+    except QueueRejected as e:
+        raise _queue_rejected_error(e)
+    except AnalysisNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected as e:
+        raise HTTPException(status_code=499, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"Error processing request: {str(e)}"
+        )
+    finally:
+        watcher.cancel()
 
 
 @app.post("/analyze", response_model=AnalysisResult)
 async def analyze(
+    request: Request,
     image: UploadFile = File(...),
     patient_info: str = Form(...),
     factors: str = Form(...),
+    x_request_timeout: Optional[float] = Header(None),
 ):
+    deadline = _request_deadline(x_request_timeout)
+
     try:
-        patient_info = PatientInfo(**json.loads(patient_info))
-        factors = [ExternalFactor(**factor) for factor in json.loads(factors)]
+        patient_info, factors = _parse_patient_inputs(patient_info, factors)
 
         contents = await image.read()
         img = Image.open(BytesIO(contents))
         if img.mode != "RGB":
             img = img.convert("RGB")
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"Error processing request: {str(e)}"
+        )
+
+    return await _run_analysis(
+        request,
+        deadline,
+        "analyze",
+        acne_analysis_system.analyze,
+        img,
+        factors,
+        patient_info,
+    )  # Añadido patient_info aquí
 
-        result = acne_analysis_system.analyze(
-            img, factors, patient_info
-        )  # Añadido patient_info aquí
-        return result
 
+@app.post("/analyze/sequence", response_model=SequenceAnalysisResult)
+async def analyze_sequence(
+    request: Request,
+    patient_info: str = Form(...),
+    factors: str = Form(...),
+    frames: List[UploadFile] = File(None),
+    video: Optional[UploadFile] = File(None),
+    top_k: int = Form(3),
+    frame_stride: int = Form(1),
+    x_request_timeout: Optional[float] = Header(None),
+):
+    deadline = _request_deadline(x_request_timeout)
+
+    try:
+        patient_info, factors = _parse_patient_inputs(patient_info, factors)
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"Error processing request: {str(e)}"
         )
+    if bool(frames) == bool(video):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of 'frames' or 'video'"
+        )
+    if not 1 <= top_k <= max_sequence_top_k:
+        raise HTTPException(
+            status_code=400,
+            detail=f"top_k must be between 1 and {max_sequence_top_k}",
+        )
+    if frame_stride < 1:
+        raise HTTPException(status_code=400, detail="frame_stride must be >= 1")
+
+    # Evita copiar el video a disco si la solicitud se rechazaría de todos modos
+    try:
+        analysis_scheduler.admit(deadline, "sequence")
+    except QueueRejected as e:
+        raise _queue_rejected_error(e)
+
+    video_path = None
+    try:
+        if video:
+            # Se copia a disco por bloques; los cuadros se decodifican uno a uno
+            suffix = os.path.splitext(video.filename or "")[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                video_path = tmp.name
+                while True:
+                    chunk = await video.read(video_chunk_size)
+                    if not chunk:
+                        break
+                    await run_in_threadpool(tmp.write, chunk)
+            frame_iter = iter_video_frames(video_path, frame_stride)
+        else:
+            frame_iter = iter_image_frames(frame.file for frame in frames)
+
+        analyze_frames = partial(acne_analysis_system.analyze_sequence, top_k=top_k)
+        return await _run_analysis(
+            request,
+            deadline,
+            "sequence",
+            analyze_frames,
+            frame_iter,
+            factors,
+            patient_info,
+        )
+    finally:
+        if video_path is not None:
+            os.remove(video_path)
+
+
+@app.patch("/analyses/{analysis_id}/factors", response_model=AnalysisResult)
+async def update_factors(
+    request: Request,
+    analysis_id: str,
+    update: FactorsUpdate,
+    x_request_timeout: Optional[float] = Header(None),
+):
+    deadline = _request_deadline(x_request_timeout)
+    return await _run_analysis(
+        request,
+        deadline,
+        "factors",
+        acne_analysis_system.reanalyze_factors,
+        analysis_id,
+        update.factors,
+    )
+
+
+@app.get("/metrics/cancellation")
+async def cancellation_metrics():
+    return analysis_scheduler.stats()
+
+
+def _require_admin(x_admin_token: Optional[str]):
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    # Se comparan bytes: compare_digest falla con str que no son ASCII
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode(), admin_token.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/profiling")
+async def profiling_status(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return {
+        **request_profiler.status(),
+        "artifacts": request_profiler.list_artifacts(),
+    }
+
+
+@app.post("/admin/profiling")
+async def start_profiling(
+    profiling_request: ProfilingRequest, x_admin_token: Optional[str] = Header(None)
+):
+    _require_admin(x_admin_token)
+    if profiling_request.requests < 1:
+        raise HTTPException(status_code=400, detail="requests must be >= 1")
+    if not 0 < profiling_request.sample_rate <= 1:
+        raise HTTPException(
+            status_code=400, detail="sample_rate must be in the range (0, 1]"
+        )
+    request_profiler.arm(
+        profiling_request.requests,
+        sample_rate=profiling_request.sample_rate,
+        torch_trace=profiling_request.torch_trace,
+    )
+    return request_profiler.status()
+
+
+@app.delete("/admin/profiling")
+async def stop_profiling(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    request_profiler.disarm()
+    return request_profiler.status()
+
+
+@app.get("/admin/profiling/artifacts/{name}")
+async def download_profile(name: str, x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    try:
+        path = request_profiler.artifact_path(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Artifact '{name}' not found")
+    return FileResponse(path, filename=name)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterable
 from PIL import Image, ImageDraw
 from io import BytesIO
 import base64
@@ -20,7 +20,20 @@ from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
 from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.charts.piecharts import Pie
 from .detection import DetectionModel
-from .data_models import PatientInfo, ExternalFactor, DetectionResult, AnalysisResult
+from .data_models import (
+    PatientInfo,
+    ExternalFactor,
+    DetectionResult,
+    AnalysisResult,
+    AnalysisRecord,
+    SequenceAnalysisResult,
+)
+from .store import AnalysisNotFound, AnalysisStore
+from .frames import select_sharpest_frames, merge_detections
+from .scheduling import Deadline
+
+# Lado máximo (px) de la imagen anotada que se incrusta en el informe
+REPORT_IMAGE_MAX_SIZE = 1200
 
 
 class ExternalFactorsAnalyzer:
@@ -57,30 +70,90 @@ class ExternalFactorsAnalyzer:
 
 
 class AcneAnalysisSystem:
+    STAGES = ("detection", "factor_analysis", "recommendations", "pdf_report")
+    SEQUENCE_STAGES = ("frame_selection",) + STAGES
+    FACTOR_STAGES = ("factor_analysis", "recommendations", "pdf_report")
+
     def __init__(
         self,
         detection_model: DetectionModel,
         external_factors_analyzer: ExternalFactorsAnalyzer,
+        store: Optional[AnalysisStore] = None,
     ):
         self.detection_model = detection_model
         self.external_factors_analyzer = external_factors_analyzer
+        self.store = store
 
     def analyze(
         self,
         image: Image.Image,
         factors: List[ExternalFactor],
         patient_info: PatientInfo,
+        deadline: Optional[Deadline] = None,
     ) -> AnalysisResult:
+        self._checkpoint(deadline, "detection")
         detections = self.detection_model.detect(image)
+        return self.analyze_detections(
+            image, detections, factors, patient_info, deadline
+        )
+
+    def analyze_sequence(
+        self,
+        frames: Iterable[Image.Image],
+        factors: List[ExternalFactor],
+        patient_info: PatientInfo,
+        top_k: int = 3,
+        merge_radius_ratio: float = 0.02,
+        deadline: Optional[Deadline] = None,
+    ) -> SequenceAnalysisResult:
+        self._checkpoint(deadline, "frame_selection")
+        selected, frames_received = select_sharpest_frames(
+            frames,
+            top_k,
+            on_frame=lambda: self._checkpoint(deadline, "frame_selection"),
+        )
+        if not selected:
+            raise ValueError("No frames received")
+
+        self._checkpoint(deadline, "detection")
+        frame_detections = self.detection_model.detect_batch(
+            [frame for _, frame in selected]
+        )
+        # El cuadro más nítido se usa como referencia para el informe
+        reference = selected[0][1]
+        detections = merge_detections(
+            frame_detections, merge_radius_ratio * max(reference.size)
+        )
+        result = self.analyze_detections(
+            reference, detections, factors, patient_info, deadline
+        )
+        return SequenceAnalysisResult(
+            **result.dict(),
+            frames_received=frames_received,
+            selected_frames=[index for index, _ in selected],
+        )
+
+    def analyze_detections(
+        self,
+        image: Image.Image,
+        detections: List[DetectionResult],
+        factors: List[ExternalFactor],
+        patient_info: PatientInfo,
+        deadline: Optional[Deadline] = None,
+    ) -> AnalysisResult:
+        self._checkpoint(deadline, "factor_analysis")
         factor_analysis = self.external_factors_analyzer.analyze(factors, detections)
         acne_type, severity = self.determine_acne_type_and_severity(
             factor_analysis, patient_info.age
         )
+        self._checkpoint(deadline, "recommendations")
         recommendations = self.generate_recommendations(
             acne_type, severity, factors, patient_info
         )
+        self._checkpoint(deadline, "pdf_report")
+        annotated_image = self.render_annotated_image(image, detections)
         pdf_report = self.generate_pdf_report(
-            image,
+            annotated_image,
             detections,
             factor_analysis,
             acne_type,
@@ -89,7 +162,19 @@ class AcneAnalysisSystem:
             patient_info,
         )
 
+        analysis_id = None
+        if self.store is not None:
+            analysis_id = self.store.save(
+                AnalysisRecord(
+                    detections=detections,
+                    factors=factors,
+                    patient_info=patient_info,
+                    annotated_image=annotated_image,
+                )
+            )
+
         return AnalysisResult(
+            analysis_id=analysis_id,
             detections=detections,
             factor_analysis=factor_analysis,
             acne_type=acne_type,
@@ -98,6 +183,55 @@ class AcneAnalysisSystem:
             pdf_report=pdf_report,
         )
 
+    def reanalyze_factors(
+        self,
+        analysis_id: str,
+        factors: List[ExternalFactor],
+        deadline: Optional[Deadline] = None,
+    ) -> AnalysisResult:
+        # Reutiliza las detecciones y la imagen anotada; no vuelve a ejecutar YOLO
+        if self.store is None:
+            raise AnalysisNotFound(analysis_id)
+        record = self.store.get(analysis_id)
+
+        self._checkpoint(deadline, "factor_analysis")
+        factor_analysis = self.external_factors_analyzer.analyze(
+            factors, record.detections
+        )
+        acne_type, severity = self.determine_acne_type_and_severity(
+            factor_analysis, record.patient_info.age
+        )
+        self._checkpoint(deadline, "recommendations")
+        recommendations = self.generate_recommendations(
+            acne_type, severity, factors, record.patient_info
+        )
+        self._checkpoint(deadline, "pdf_report")
+        pdf_report = self.generate_pdf_report(
+            record.annotated_image,
+            record.detections,
+            factor_analysis,
+            acne_type,
+            severity,
+            recommendations,
+            record.patient_info,
+        )
+        self.store.update(analysis_id, record.copy(update={"factors": factors}))
+
+        return AnalysisResult(
+            analysis_id=analysis_id,
+            detections=record.detections,
+            factor_analysis=factor_analysis,
+            acne_type=acne_type,
+            severity=severity,
+            recommendations=recommendations,
+            pdf_report=pdf_report,
+        )
+
+    @staticmethod
+    def _checkpoint(deadline: Optional[Deadline], stage: str):
+        if deadline is not None:
+            deadline.check(stage)
+
     def determine_acne_type_and_severity(
         self, factor_analysis: Dict[str, float], age: int
     ) -> Tuple[str, str]:
@@ -179,9 +313,27 @@ class AcneAnalysisSystem:
         )
         return recommendations
 
+    def render_annotated_image(
+        self, image: Image.Image, detections: List[DetectionResult]
+    ) -> bytes:
+        # El informe dibuja la imagen a 4x4 pulgadas; basta con ~300 ppp
+        img_copy = image.copy()
+        img_copy.thumbnail((REPORT_IMAGE_MAX_SIZE, REPORT_IMAGE_MAX_SIZE))
+        scale = img_copy.width / image.width
+        draw = ImageDraw.Draw(img_copy)
+        for detection in detections:
+            x, y = detection.center
+            x, y = x * scale, y * scale
+            r = 5  # Radio del círculo
+            draw.ellipse((x - r, y - r, x + r, y + r), outline="red", width=2)
+
+        img_buffer = BytesIO()
+        img_copy.save(img_buffer, format="JPEG", quality=90)
+        return img_buffer.getvalue()
+
     def generate_pdf_report(
         self,
-        image: Image.Image,
+        annotated_image: bytes,
         detections: List[DetectionResult],
         factor_analysis: Dict[str, float],
         acne_type: str,
@@ -273,16 +425,7 @@ class AcneAnalysisSystem:
 
         # Análisis de Imagen
         content.append(Paragraph("Análisis de Imagen", styles["Heading1"]))
-        img_copy = image.copy()
-        draw = ImageDraw.Draw(img_copy)
-        for detection in detections:
-            x, y = detection.center
-            r = 5  # Radio del círculo
-            draw.ellipse((x - r, y - r, x + r, y + r), outline="red", width=2)
-
-        img_buffer = BytesIO()
-        img_copy.save(img_buffer, format="PNG")
-        img_buffer.seek(0)
+        img_buffer = BytesIO(annotated_image)
         content.append(ReportLabImage(img_buffer, width=4 * inch, height=4 * inch))
         content.append(Spacer(1, 12))
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 class PatientInfo(BaseModel):
@@ -20,9 +20,33 @@ class DetectionResult(BaseModel):
 
 
 class AnalysisResult(BaseModel):
+    analysis_id: Optional[str] = None
     detections: List[DetectionResult]
     factor_analysis: Dict[str, float]
     acne_type: str
     severity: str
     recommendations: List[str]
     pdf_report: str
+
+
+class SequenceAnalysisResult(AnalysisResult):
+    frames_received: int
+    selected_frames: List[int]
+
+
+class FactorsUpdate(BaseModel):
+    factors: List[ExternalFactor]
+
+
+class AnalysisRecord(BaseModel):
+    # Lo necesario para recalcular un análisis sin volver a ejecutar la detección
+    detections: List[DetectionResult]
+    factors: List[ExternalFactor]
+    patient_info: PatientInfo
+    annotated_image: bytes
+
+
+class ProfilingRequest(BaseModel):
+    requests: int
+    sample_rate: float = 1.0
+    torch_trace: bool = True
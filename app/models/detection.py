@@ -1,28 +1,44 @@
+import threading
 from ultralytics import YOLO
 from PIL import Image
 from typing import List
 from .data_models import DetectionResult
+from .profiling import inference_profile
 
 
 class DetectionModel:
     def __init__(self, model_path: str):
         self.model = YOLO(model_path)
+        # El predictor de ultralytics no es seguro entre hilos
+        self._lock = threading.Lock()
 
     def detect(self, image: Image.Image) -> List[DetectionResult]:
-        results = self.model(image)
+        with self._lock, inference_profile():
+            results = self.model(image)
         detections = []
         for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                confidence = box.conf[0]
-                class_id = box.cls[0]
-                class_name = self.model.names[int(class_id)]
-                detections.append(
-                    DetectionResult(
-                        center=[(x1 + x2) / 2, (y1 + y2) / 2],
-                        confidence=float(confidence),
-                        class_name=class_name,
-                    )
+            detections.extend(self._parse_result(r))
+        return detections
+
+    def detect_batch(self, images: List[Image.Image]) -> List[List[DetectionResult]]:
+        if not images:
+            return []
+        with self._lock, inference_profile():
+            results = self.model(images)
+        return [self._parse_result(r) for r in results]
+
+    def _parse_result(self, result) -> List[DetectionResult]:
+        detections = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = box.xyxy[0]
+            confidence = box.conf[0]
+            class_id = box.cls[0]
+            class_name = self.model.names[int(class_id)]
+            detections.append(
+                DetectionResult(
+                    center=[(x1 + x2) / 2, (y1 + y2) / 2],
+                    confidence=float(confidence),
+                    class_name=class_name,
                 )
+            )
         return detections
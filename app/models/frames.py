@@ -0,0 +1,133 @@
+import heapq
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from skimage.color import rgb2gray
+from skimage.filters import laplace
+
+from .data_models import DetectionResult
+
+# Lado máximo de la miniatura usada para puntuar la nitidez
+SHARPNESS_THUMBNAIL_SIZE = 256
+
+
+def iter_image_frames(files: Iterable[BinaryIO]) -> Iterator[Image.Image]:
+    # Las detecciones se fusionan en coordenadas de píxel: todos los cuadros
+    # deben tener el tamaño del primero
+    size = None
+    for index, file in enumerate(files):
+        img = Image.open(file)
+        if size is None:
+            size = img.size
+        elif img.size != size:
+            raise ValueError(
+                f"Frame {index} has size {img.size[0]}x{img.size[1]}, "
+                f"expected {size[0]}x{size[1]}"
+            )
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        yield img
+
+
+def iter_video_frames(path: str, stride: int = 1) -> Iterator[Image.Image]:
+    # Decodifica un cuadro a la vez para no mantener el video completo en memoria
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not decode video")
+    try:
+        index = 0
+        while True:
+            if index % stride == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def sharpness_score(image: Image.Image) -> float:
+    thumbnail = image.copy()
+    thumbnail.thumbnail((SHARPNESS_THUMBNAIL_SIZE, SHARPNESS_THUMBNAIL_SIZE))
+    gray = rgb2gray(np.asarray(thumbnail))
+    return float(laplace(gray).var())
+
+
+def select_sharpest_frames(
+    frames: Iterable[Image.Image], top_k: int, on_frame=None
+) -> Tuple[List[Tuple[int, Image.Image]], int]:
+    # Min-heap de tamaño top_k: solo los mejores cuadros quedan en memoria
+    heap: List[Tuple[float, int, Image.Image]] = []
+    received = 0
+    for index, frame in enumerate(frames):
+        if on_frame is not None:
+            on_frame()
+        received += 1
+        entry = (sharpness_score(frame), index, frame)
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    ranked = sorted(heap, key=lambda entry: entry[0], reverse=True)
+    return [(index, frame) for _, index, frame in ranked], received
+
+
+def merge_detections(
+    frame_detections: List[List[DetectionResult]], radius: float
+) -> List[DetectionResult]:
+    if not frame_detections:
+        return []
+
+    candidates = [
+        (frame_index, detection)
+        for frame_index, detections in enumerate(frame_detections)
+        for detection in detections
+    ]
+    candidates.sort(key=lambda candidate: candidate[1].confidence, reverse=True)
+
+    # Agrupa detecciones de la misma clase cuyos centros están a menos de `radius`.
+    # Cada grupo acepta como máximo una detección por cuadro, para no fusionar
+    # lesiones distintas que aparecen juntas en el mismo cuadro.
+    clusters: List[Dict[int, DetectionResult]] = []
+    for frame_index, detection in candidates:
+        x, y = detection.center
+        best_cluster, best_distance = None, radius**2
+        for cluster in clusters:
+            anchor = next(iter(cluster.values()))
+            if anchor.class_name != detection.class_name or frame_index in cluster:
+                continue
+            cx, cy = anchor.center
+            distance = (x - cx) ** 2 + (y - cy) ** 2
+            if distance <= best_distance:
+                best_cluster, best_distance = cluster, distance
+        if best_cluster is None:
+            clusters.append({frame_index: detection})
+        else:
+            best_cluster[frame_index] = detection
+
+    merged = []
+    for cluster in clusters:
+        members = list(cluster.values())
+        total_confidence = sum(detection.confidence for detection in members)
+        center = [
+            sum(detection.center[axis] * detection.confidence for detection in members)
+            / total_confidence
+            for axis in range(2)
+        ]
+        # Confianza media en los cuadros donde aparece, ponderada por la fracción
+        # de cuadros que la contienen: una lesión vista en pocos cuadros aporta menos
+        coverage = len(members) / len(frame_detections)
+        merged.append(
+            DetectionResult(
+                class_name=members[0].class_name,
+                confidence=total_confidence / len(members) * coverage,
+                center=center,
+            )
+        )
+    return merged
@@ -0,0 +1,176 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List
+
+import torch
+
+_local = threading.local()
+logger = logging.getLogger(__name__)
+
+
+class _ProfileSession:
+    def __init__(self, capture_id: str, output_dir: str, torch_trace: bool):
+        self.capture_id = capture_id
+        self.output_dir = output_dir
+        self.torch_trace = torch_trace
+
+    def path(self, suffix: str) -> str:
+        return os.path.join(self.output_dir, f"{self.capture_id}{suffix}")
+
+
+class RequestProfiler:
+    def __init__(self, output_dir: str, max_captures: int = 20):
+        self.output_dir = output_dir
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._sample_rate = 1.0
+        self._torch_trace = True
+
+    def arm(self, requests: int, sample_rate: float = 1.0, torch_trace: bool = True):
+        with self._lock:
+            self._remaining = requests
+            self._sample_rate = sample_rate
+            self._torch_trace = torch_trace
+
+    def disarm(self):
+        with self._lock:
+            self._remaining = 0
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "remaining": self._remaining,
+                "sample_rate": self._sample_rate,
+                "torch_trace": self._torch_trace,
+            }
+
+    def wrap(self, fn: Callable, label: str) -> Callable:
+        @wraps(fn)
+        def profiled(*args, **kwargs):
+            with self.capture(label):
+                return fn(*args, **kwargs)
+
+        return profiled
+
+    @contextmanager
+    def capture(self, label: str):
+        # Camino rápido: sin capturas pendientes no se toma el lock
+        if self._remaining <= 0:
+            yield
+            return
+        session = self._claim(label)
+        if session is None:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        _local.session = session
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            _local.session = None
+            # Un fallo al guardar el perfil nunca debe alterar la respuesta
+            try:
+                self._write_profile(session, profile, label, elapsed)
+                self._prune()
+            except Exception:
+                logger.exception("Could not save profile %s", session.capture_id)
+
+    def _claim(self, label: str):
+        with self._lock:
+            if self._remaining <= 0 or random.random() >= self._sample_rate:
+                return None
+            self._remaining -= 1
+            torch_trace = self._torch_trace
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+        except OSError:
+            logger.exception("Could not create profile directory %s", self.output_dir)
+            return None
+        capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}"
+        return _ProfileSession(capture_id, self.output_dir, torch_trace)
+
+    def _write_profile(
+        self,
+        session: _ProfileSession,
+        profile: cProfile.Profile,
+        label: str,
+        elapsed: float,
+    ):
+        profile.dump_stats(session.path(".prof"))
+        report = io.StringIO()
+        report.write(f"{label}: {elapsed:.3f}s\n\n")
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(50)
+        with open(session.path(".txt"), "w") as f:
+            f.write(report.getvalue())
+
+    def _prune(self):
+        # Conserva solo las capturas más recientes
+        with self._lock:
+            captures: Dict[str, List[str]] = {}
+            for name in os.listdir(self.output_dir):
+                capture_id = name.split(".", 1)[0]
+                captures.setdefault(capture_id, []).append(name)
+            oldest_first = sorted(
+                captures,
+                key=lambda capture_id: max(
+                    os.path.getmtime(os.path.join(self.output_dir, name))
+                    for name in captures[capture_id]
+                ),
+            )
+            excess = max(len(oldest_first) - self.max_captures, 0)
+            for capture_id in oldest_first[:excess]:
+                for name in captures[capture_id]:
+                    os.remove(os.path.join(self.output_dir, name))
+
+    def list_artifacts(self) -> List[Dict[str, object]]:
+        if not os.path.isdir(self.output_dir):
+            return []
+        # Con el lock tomado, _prune no puede borrar archivos mientras se listan
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "size": os.path.getsize(os.path.join(self.output_dir, name)),
+                }
+                for name in sorted(os.listdir(self.output_dir))
+            ]
+
+    def artifact_path(self, name: str) -> str:
+        if name not in {artifact["name"] for artifact in self.list_artifacts()}:
+            raise KeyError(name)
+        return os.path.join(self.output_dir, name)
+
+
+@contextmanager
+def inference_profile():
+    session = getattr(_local, "session", None)
+    if session is None or not session.torch_trace:
+        yield
+        return
+
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+        yield
+    try:
+        prof.export_chrome_trace(session.path(".torch.json"))
+        with open(session.path(".torch.txt"), "w") as f:
+            f.write(prof.key_averages().table(sort_by="cpu_time_total", row_limit=50))
+    except Exception:
+        logger.exception("Could not save torch trace %s", session.capture_id)
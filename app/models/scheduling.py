@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+
+class AnalysisCancelled(Exception):
+    def __init__(
+        self,
+        stage: str,
+        reason: str,
+        before_start: bool = True,
+        stage_started: bool = False,
+    ):
+        super().__init__(f"Analysis cancelled at stage '{stage}': {reason}")
+        self.stage = stage
+        self.reason = reason
+        # False si el trabajo ya había pasado algún punto de control
+        self.before_start = before_start
+        # True si se canceló a mitad de `stage` (p. ej. entre cuadros)
+        self.stage_started = stage_started
+
+
+class ClientDisconnected(AnalysisCancelled):
+    def __init__(
+        self, stage: str, before_start: bool = True, stage_started: bool = False
+    ):
+        super().__init__(stage, "client disconnected", before_start, stage_started)
+
+
+class DeadlineExceeded(AnalysisCancelled):
+    def __init__(
+        self, stage: str, before_start: bool = True, stage_started: bool = False
+    ):
+        super().__init__(stage, "deadline exceeded", before_start, stage_started)
+
+
+class QueueRejected(Exception):
+    def __init__(self, estimated_completion: float, remaining: float):
+        super().__init__(
+            f"Estimated completion in {estimated_completion:.2f}s exceeds the "
+            f"remaining deadline of {remaining:.2f}s"
+        )
+        self.estimated_completion = estimated_completion
+        self.remaining = remaining
+
+
+class Deadline:
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+        self._cancel_callbacks: List[Callable[[], object]] = []
+        self._last_stage = None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def cancel(self):
+        self._cancelled.set()
+        for callback in self._cancel_callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], object]):
+        self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self, stage: str):
+        # Se llama entre etapas del pipeline desde el hilo de trabajo
+        before_start = self._last_stage is None
+        stage_started = stage == self._last_stage
+        if self.cancelled:
+            raise ClientDisconnected(stage, before_start, stage_started)
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage, before_start, stage_started)
+        self._last_stage = stage
+
+
+class AnalysisScheduler:
+    def __init__(
+        self,
+        stages_by_kind: Dict[str, Sequence[str]],
+        max_workers: int = 1,
+        initial_service_time: float = 2.0,
+        smoothing: float = 0.2,
+    ):
+        # Etapas del pipeline de cada tipo de análisis, en orden de ejecución
+        self.stages_by_kind = {
+            kind: list(stages) for kind, stages in stages_by_kind.items()
+        }
+        self.max_workers = max_workers
+        self.smoothing = smoothing
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self.initial_service_time = initial_service_time
+        self._pending = 0
+        # Tiempo de servicio y trabajos pendientes por tipo de análisis
+        self._service_times: Dict[str, float] = {}
+        self._pending_by_kind: Dict[str, int] = {}
+        self._counters = {
+            "completed": 0,
+            "rejected_early": 0,
+            "cancelled_client_disconnected": 0,
+            "cancelled_deadline_exceeded": 0,
+            "cancelled_before_start": 0,
+        }
+        self._stages_skipped = {
+            stage: 0 for stages in self.stages_by_kind.values() for stage in stages
+        }
+
+    def _service_time(self, kind: str) -> float:
+        return self._service_times.get(kind, self.initial_service_time)
+
+    def estimated_completion(self, kind: str) -> float:
+        with self._lock:
+            wait = 0.0
+            if self._pending >= self.max_workers:
+                queued_work = sum(
+                    count * self._service_time(pending_kind)
+                    for pending_kind, count in self._pending_by_kind.items()
+                )
+                wait = queued_work / self.max_workers
+            return wait + self._service_time(kind)
+
+    def admit(self, deadline: Deadline, kind: str):
+        # Rechaza de inmediato si la cola actual no permite terminar a tiempo
+        estimate = self.estimated_completion(kind)
+        remaining = deadline.remaining()
+        if estimate > remaining:
+            with self._lock:
+                self._counters["rejected_early"] += 1
+            raise QueueRejected(estimate, remaining)
+
+    async def run(self, deadline: Deadline, kind: str, fn: Callable, *args):
+        self.admit(deadline, kind)
+
+        with self._lock:
+            self._pending += 1
+            self._pending_by_kind[kind] = self._pending_by_kind.get(kind, 0) + 1
+        future = self._executor.submit(self._execute, deadline, kind, fn, *args)
+        # Se descuenta al terminar o al cancelarse mientras aún está en cola
+        future.add_done_callback(lambda done: self._on_done(done, deadline, kind))
+        # Si el cliente se desconecta, libera de inmediato el lugar en la cola;
+        # un trabajo ya iniciado se detiene en el siguiente punto de control
+        deadline.on_cancel(future.cancel)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled() and deadline.cancelled:
+                raise ClientDisconnected(self.stages_by_kind.get(kind, ["queued"])[0])
+            raise
+
+    def _on_done(self, future, deadline: Deadline, kind: str):
+        with self._lock:
+            self._pending -= 1
+            self._pending_by_kind[kind] -= 1
+            if future.cancelled():
+                if deadline.cancelled:
+                    self._counters["cancelled_client_disconnected"] += 1
+                self._counters["cancelled_before_start"] += 1
+                for stage in self.stages_by_kind.get(kind, []):
+                    self._stages_skipped[stage] += 1
+
+    def _execute(self, deadline: Deadline, kind: str, fn: Callable, *args):
+        started = time.monotonic()
+        try:
+            result = fn(*args, deadline=deadline)
+        except AnalysisCancelled as exc:
+            self._record_cancellation(exc, kind)
+            raise
+        else:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._counters["completed"] += 1
+                service_time = self._service_time(kind)
+                self._service_times[kind] = service_time + self.smoothing * (
+                    elapsed - service_time
+                )
+            return result
+
+    def _record_cancellation(self, exc: AnalysisCancelled, kind: str):
+        if isinstance(exc, ClientDisconnected):
+            key = "cancelled_client_disconnected"
+        else:
+            key = "cancelled_deadline_exceeded"
+        with self._lock:
+            self._counters[key] += 1
+            if exc.before_start:
+                self._counters["cancelled_before_start"] += 1
+            stages = self.stages_by_kind.get(kind, [])
+            if exc.stage not in stages:
+                return
+            first_skipped = stages.index(exc.stage) + int(exc.stage_started)
+            for stage in stages[first_skipped:]:
+                self._stages_skipped[stage] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats: Dict[str, object] = dict(self._counters)
+            stats["stages_skipped"] = dict(self._stages_skipped)
+            stats["pending"] = self._pending
+            stats["estimated_service_time"] = dict(self._service_times)
+        return stats
+
+
+async def watch_disconnect(request, deadline: Deadline, poll_interval: float = 0.5):
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            deadline.cancel()
+            return
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,57 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Tuple
+
+from .data_models import AnalysisRecord
+
+
+class AnalysisNotFound(Exception):
+    def __init__(self, analysis_id: str):
+        super().__init__(f"Analysis '{analysis_id}' not found or expired")
+        self.analysis_id = analysis_id
+
+
+class AnalysisStore:
+    def __init__(
+        self, max_entries: int = 128, ttl: float = 3600.0, max_bytes: int = 64 << 20
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, Tuple[float, AnalysisRecord]]" = OrderedDict()
+
+    def save(self, record: AnalysisRecord) -> str:
+        analysis_id = uuid.uuid4().hex
+        self.update(analysis_id, record)
+        return analysis_id
+
+    def update(self, analysis_id: str, record: AnalysisRecord):
+        with self._lock:
+            self._discard(analysis_id)
+            self._records[analysis_id] = (time.monotonic() + self.ttl, record)
+            self._bytes += len(record.annotated_image)
+            # Descarta los análisis menos usados recientemente
+            while len(self._records) > self.max_entries or (
+                self._bytes > self.max_bytes and len(self._records) > 1
+            ):
+                self._discard(next(iter(self._records)))
+
+    def _discard(self, analysis_id: str):
+        entry = self._records.pop(analysis_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].annotated_image)
+
+    def get(self, analysis_id: str) -> AnalysisRecord:
+        with self._lock:
+            if analysis_id not in self._records:
+                raise AnalysisNotFound(analysis_id)
+            expires_at, record = self._records[analysis_id]
+            if expires_at < time.monotonic():
+                self._discard(analysis_id)
+                raise AnalysisNotFound(analysis_id)
+            self._records.move_to_end(analysis_id)
+            return record
@@ -70,3 +70,9 @@ def list(c):
 def test(c):
     """Predicción de prueba."""
     c.run("python testing/test.py")
+
+
+@task
+def unit(c):
+    """Pruebas unitarias que no requieren el modelo."""
+    c.run("python testing/test_units.py")
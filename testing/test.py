@@ -4,6 +4,17 @@ import os
 import base64
 
 
+PATIENT_INFO = {"name": "Paciente de Prueba", "age": 25, "sex": 0}
+
+FACTORS = [
+    {"name": "stress_level", "value": 4},
+    {"name": "diet_quality", "value": 7},
+    {"name": "skin_type", "value": 2},
+    {"name": "sun_exposure", "value": 1},
+    {"name": "makeup_use", "value": 1},
+]
+
+
 def test_analyze_endpoint(image_path, server_url="http://localhost:8000"):
     if not os.path.exists(image_path):
         print(f"Error: El archivo {image_path} no existe.")
@@ -12,19 +23,11 @@ def test_analyze_endpoint(image_path, server_url="http://localhost:8000"):
     with open(image_path, "rb") as image_file:
         files = {"image": ("image.jpg", image_file, "image/jpeg")}
 
-        patient_info = {"name": "Paciente de Prueba", "age": 25, "sex": 0}
-
-        factors = [
-            {"name": "stress_level", "value": 4},
-            {"name": "diet_quality", "value": 7},
-            {"name": "skin_type", "value": 2},
-            {"name": "sun_exposure", "value": 1},
-            {"name": "makeup_use", "value": 1},
-        ]
+        patient_info = PATIENT_INFO
 
         data = {
             "patient_info": json.dumps(patient_info),
-            "factors": json.dumps(factors),
+            "factors": json.dumps(FACTORS),
         }
 
         try:
@@ -68,6 +71,7 @@ def test_analyze_endpoint(image_path, server_url="http://localhost:8000"):
             with open(pdf_path, "wb") as pdf_file:
                 pdf_file.write(pdf_data)
             print(f"Informe PDF guardado como '{pdf_path}'")
+            return result
 
         except requests.exceptions.RequestException as e:
             print(f"Error en la solicitud: {e}")
@@ -81,7 +85,92 @@ def test_analyze_endpoint(image_path, server_url="http://localhost:8000"):
             print(f"Error inesperado: {e}")
 
 
+def test_sequence_endpoint(
+    image_path, frame_count=3, server_url="http://localhost:8000"
+):
+    if not os.path.exists(image_path):
+        print(f"Error: El archivo {image_path} no existe.")
+        return
+
+    with open(image_path, "rb") as image_file:
+        content = image_file.read()
+
+    # Simula una ráfaga enviando la misma imagen varias veces
+    files = [
+        ("frames", (f"frame_{index}.png", content, "image/png"))
+        for index in range(frame_count)
+    ]
+    data = {
+        "patient_info": json.dumps(PATIENT_INFO),
+        "factors": json.dumps(FACTORS),
+        "top_k": "2",
+    }
+
+    try:
+        response = requests.post(
+            f"{server_url}/analyze/sequence", files=files, data=data
+        )
+        response.raise_for_status()
+        result = response.json()
+        print("\nAnálisis de ráfaga completado con éxito.")
+        print(f"  Cuadros recibidos: {result['frames_received']}")
+        print(f"  Cuadros seleccionados: {result['selected_frames']}")
+        print(f"  Detecciones combinadas: {len(result['detections'])}")
+        print(f"  Severidad: {result['severity']}")
+
+        assert result["frames_received"] == frame_count
+        assert len(result["selected_frames"]) == 2
+        return result
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error en la solicitud: {e}")
+        if hasattr(e, "response") and e.response is not None:
+            print(f"Respuesta del servidor: {e.response.text}")
+    except (KeyError, AssertionError) as e:
+        print(f"Error: Respuesta inesperada del servidor: {e}")
+
+
+def test_update_factors_endpoint(analysis_id, server_url="http://localhost:8000"):
+    # El paciente corrige sus respuestas: más estrés y peor dieta
+    factors = [dict(factor) for factor in FACTORS]
+    for factor in factors:
+        if factor["name"] == "stress_level":
+            factor["value"] = 9
+        elif factor["name"] == "diet_quality":
+            factor["value"] = 3
+
+    try:
+        response = requests.patch(
+            f"{server_url}/analyses/{analysis_id}/factors", json={"factors": factors}
+        )
+        response.raise_for_status()
+        result = response.json()
+        print("\nReanálisis de factores completado con éxito.")
+        print(f"  Severidad: {result['severity']}")
+        for recommendation in result["recommendations"]:
+            print(f"  - {recommendation}")
+
+        assert result["analysis_id"] == analysis_id
+        assert any("estrés" in r for r in result["recommendations"])
+
+        missing = requests.patch(
+            f"{server_url}/analyses/no-existe/factors", json={"factors": factors}
+        )
+        assert missing.status_code == 404
+        return result
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error en la solicitud: {e}")
+        if hasattr(e, "response") and e.response is not None:
+            print(f"Respuesta del servidor: {e.response.text}")
+    except (KeyError, AssertionError) as e:
+        print(f"Error: Respuesta inesperada del servidor: {e}")
+
+
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
     image_path = os.path.join(script_dir, "acne.png")
-    test_analyze_endpoint(image_path)
+    result = test_analyze_endpoint(image_path)
+    if result is not None:
+        test_update_factors_endpoint(result["analysis_id"])
+    test_sequence_endpoint(image_path)
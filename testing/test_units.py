@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.data_models import (  # noqa: E402
+    AnalysisRecord,
+    DetectionResult,
+    PatientInfo,
+)
+from app.models.frames import merge_detections  # noqa: E402
+from app.models.scheduling import (  # noqa: E402
+    AnalysisScheduler,
+    ClientDisconnected,
+    Deadline,
+)
+from app.models.store import AnalysisNotFound, AnalysisStore  # noqa: E402
+
+
+def _record(image_size):
+    return AnalysisRecord(
+        detections=[],
+        factors=[],
+        patient_info=PatientInfo(name="Paciente", age=25, sex=0),
+        annotated_image=b"x" * image_size,
+    )
+
+
+def _assert_missing(store, analysis_id):
+    try:
+        store.get(analysis_id)
+        raise AssertionError(f"{analysis_id} should have been evicted")
+    except AnalysisNotFound:
+        pass
+
+
+def test_merge_detections_keeps_nearby_lesions_in_same_frame():
+    frame = [
+        DetectionResult(class_name="papula", confidence=0.8, center=[100.0, 100.0]),
+        DetectionResult(class_name="papula", confidence=0.8, center=[110.0, 100.0]),
+    ]
+    merged = merge_detections([frame], radius=38.0)
+    assert len(merged) == 2
+    assert all(abs(detection.confidence - 0.8) < 1e-9 for detection in merged)
+
+
+def test_merge_detections_scales_confidence_by_frame_coverage():
+    seen = DetectionResult(class_name="papula", confidence=0.9, center=[50.0, 50.0])
+    moved = DetectionResult(class_name="papula", confidence=0.7, center=[54.0, 50.0])
+    merged = merge_detections([[seen], [moved], []], radius=10.0)
+    assert len(merged) == 1
+    assert abs(merged[0].confidence - (0.9 + 0.7) / 3) < 1e-9
+    assert 50.0 < merged[0].center[0] < 54.0
+
+
+def test_scheduler_releases_queued_job_on_disconnect():
+    scheduler = AnalysisScheduler(
+        {"analyze": ("detection", "pdf_report")}, initial_service_time=0.01
+    )
+    release = threading.Event()
+
+    def blocking_job(deadline):
+        release.wait(5)
+        return "done"
+
+    async def scenario():
+        first, second = Deadline(10), Deadline(10)
+        running = asyncio.ensure_future(scheduler.run(first, "analyze", blocking_job))
+        queued = asyncio.ensure_future(scheduler.run(second, "analyze", blocking_job))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["pending"] == 2
+
+        # El trabajo en cola se libera sin esperar a que llegue a un worker
+        second.cancel()
+        try:
+            await queued
+            raise AssertionError("queued job should have been cancelled")
+        except ClientDisconnected:
+            pass
+        assert scheduler.stats()["pending"] == 1
+
+        release.set()
+        assert await running == "done"
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()
+    assert stats["pending"] == 0
+    assert stats["completed"] == 1
+    assert stats["cancelled_before_start"] == 1
+    assert stats["cancelled_client_disconnected"] == 1
+    assert stats["stages_skipped"] == {"detection": 1, "pdf_report": 1}
+
+
+def test_store_evicts_least_recently_used_by_entry_count():
+    store = AnalysisStore(max_entries=2, max_bytes=1 << 20)
+    first = store.save(_record(10))
+    second = store.save(_record(10))
+    store.get(first)  # `first` pasa a ser el más reciente
+    third = store.save(_record(10))
+
+    _assert_missing(store, second)
+    assert store.get(first) is not None
+    assert store.get(third) is not None
+
+
+def test_store_evicts_by_total_bytes():
+    store = AnalysisStore(max_entries=10, max_bytes=250)
+    first = store.save(_record(100))
+    second = store.save(_record(100))
+    third = store.save(_record(100))
+
+    _assert_missing(store, first)
+    assert store.get(second) is not None
+    assert store.get(third) is not None
+
+    # Reemplazar un registro no cuenta sus bytes dos veces
+    store.update(third, _record(100))
+    assert store.get(second) is not None
+
+
+if __name__ == "__main__":
+    for name, check in list(globals().items()):
+        if name.startswith("test_") and callable(check):
+            check()
+            print(f"OK  {name}")